@@ -4,37 +4,27 @@ agi_main.py - AGI entry point for your Zomato customer support bot.
 This script is invoked by Asterisk via AGI and uses file-based audio I/O.
 """
 
-import os
-import re
 import sys
-import time
 from asterisk.agi import AGI
 
 # Import modules from your codebase
-from src.ai import llm_client
 from src.data import data_fetcher
 from src.utils import logger
+from src.utils.intents import EXIT_KEYWORDS_RE, extract_order_number
 from src.speech import tts, stt
+from src.speech.playback import play_llm_response
+from src.config import RECORDING_DIR
 
-def extract_order_number(text):
-    """
-    Extracts order numbers from user input using regex.
-    """
-    pattern = r'\b(?:order(?:\s*(?:id|number))?|id|number)?\s*(?:is|was|should be|supposed to be)?\s*[:#]?\s*(\d{3,10})'
-    match = re.search(pattern, text, re.IGNORECASE)
-    if match:
-        print(f"[DEBUG] Extracted order number via Regex: {match.group(1)}")
-        return match.group(1)
-    if text.strip().isdigit():
-        print(f"[DEBUG] Extracted standalone order number: {text.strip()}")
-        return text.strip()
-    print("[DEBUG] No order number found in the input.")
-    return None
+log = logger.setup_logger()
+
+WELCOME_MESSAGE = "Welcome to Zomato customer support. How can I assist you today?"
+
+SYSTEM_PROMPT = ("You are a female customer support executive working for Zomato. "
+                 "Answer all customer queries in a friendly, concise, and professional manner.")
 
 def agi_main_flow():
-    # Initialize AGI and logger
+    # Initialize AGI
     agi = AGI()
-    log = logger.setup_logger()
     agi.verbose("Starting AGI Voice Support Bot", level=1)
     
     # Dump AGI environment for debugging
@@ -45,30 +35,25 @@ def agi_main_flow():
     uniqueid = env.get("agi_uniqueid", "default")
     
     # === Play Welcome Message ===
-    welcome_message = "Welcome to Zomato customer support. How can I assist you today?"
-    welcome_wav = f"/var/lib/asterisk/sounds/welcome_{uniqueid}.wav"
-    tts.generate_tts_file(welcome_message, welcome_wav)
-    # Assume the conversion creates /var/lib/asterisk/sounds/welcome_{uniqueid}.ulaw
+    welcome_sound = tts.get_cached_tts_file(WELCOME_MESSAGE)
     agi.verbose("Playing welcome message", level=1)
-    # Play using stream_file (omit extension)
-    agi.stream_file(f"welcome_{uniqueid}")
+    # Play using stream_file (cached path, extension omitted)
+    agi.stream_file(welcome_sound)
     
     # Initialize conversation history with a system prompt
-    system_prompt = ("You are a female customer support executive working for Zomato. "
-                     "Answer all customer queries in a friendly, concise, and professional manner.")
-    conversation_history = [{"role": "system", "content": system_prompt}]
-    exit_keywords = ["bye", "exit", "quit", "end call", "goodbye", "thank you", "that's all"]
+    conversation_history = [{"role": "system", "content": SYSTEM_PROMPT}]
+    # Orders already looked up this session; their details are in the history
+    fetched_orders = set()
     
     while True:
         agi.verbose("Recording caller input", level=1)
-        input_filename = f"input_{uniqueid}"
-        input_wav = f"/var/lib/asterisk/sounds/{input_filename}.wav"
+        # Absolute path: Asterisk records straight into RECORDING_DIR
+        input_filename = f"{RECORDING_DIR}/input_{uniqueid}"
+        input_wav = f"{input_filename}.wav"
         
         agi.verbose("About to record caller input", level=1)
         agi.record_file(input_filename, format="wav", escape_digits="#", timeout=60000, offset=0, beep="beep", silence=2)
-        time.sleep(2)
-        
-        if os.path.exists(input_wav):
+        if stt.wait_for_recording(input_wav):
             agi.verbose(f"Recording file exists: {input_wav}", level=1)
         else:
             agi.verbose(f"Recording file NOT found: {input_wav}", level=1)
@@ -77,26 +62,25 @@ def agi_main_flow():
         agi.verbose(f"STT returned: {user_input}", level=1)
         
         if not user_input:
-            goodbye_message = "No input received. Ending session. Goodbye!"
-            goodbye_wav = f"/var/lib/asterisk/sounds/goodbye_{uniqueid}.wav"
-            tts.generate_tts_file(goodbye_message, goodbye_wav)
+            goodbye_sound = tts.get_cached_tts_file("No input received. Ending session. Goodbye!")
             agi.verbose("Playing goodbye message", level=1)
-            agi.stream_file(f"goodbye_{uniqueid}")
+            agi.stream_file(goodbye_sound)
             break
         
         agi.verbose(f"User said: {user_input}", level=1)
         conversation_history.append({"role": "user", "content": user_input})
         
-        if any(keyword in user_input.lower() for keyword in exit_keywords):
-            goodbye_message = "Thank you for contacting Zomato support. Have a great day!"
-            goodbye_wav = f"/var/lib/asterisk/sounds/goodbye_{uniqueid}.wav"
-            tts.generate_tts_file(goodbye_message, goodbye_wav)
+        if EXIT_KEYWORDS_RE.search(user_input):
+            goodbye_sound = tts.get_cached_tts_file("Thank you for contacting Zomato support. Have a great day!")
             agi.verbose("Playing goodbye message", level=1)
-            agi.stream_file(f"goodbye_{uniqueid}")
+            agi.stream_file(goodbye_sound)
             break
         
         order_number = extract_order_number(user_input)
-        if order_number:
+        if order_number in fetched_orders:
+            log.info("Order %s already in context.", order_number)
+        elif order_number:
+            fetched_orders.add(order_number)
             order_data = data_fetcher.fetch_order_data(order_number, source="csv")
             log.info("Fetched Order Data: %s", order_data)
             order_context = f"Order details for order {order_number}: {order_data}"
@@ -104,16 +88,11 @@ def agi_main_flow():
         else:
             log.info("No order number found in input.")
         
-        ai_response = llm_client.query_llm(conversation_history)
-        clean_response = ai_response.replace("<|im_start|>assistant<|im_sep|>", "").replace("<|im_end|>", "").strip()
+        agi.verbose("Playing AI response", level=1)
+        # Sentences are synthesized and played while the rest of the answer streams in
+        clean_response = play_llm_response(agi, conversation_history, f"response_{uniqueid}")
         conversation_history.append({"role": "assistant", "content": clean_response})
         agi.verbose(f"AI Response: {clean_response}", level=1)
-        
-        response_wav = f"/var/lib/asterisk/sounds/response_{uniqueid}.wav"
-        tts.generate_tts_file(clean_response, response_wav)
-        agi.verbose("Playing AI response", level=1)
-        # Play the converted ulaw file (base name without extension)
-        agi.stream_file(f"response_{uniqueid}")
     
     agi.hangup()
 
@@ -5,12 +5,63 @@ This server listens for AGI requests over TCP and dispatches them to your AGI lo
 """
 
 import socketserver
+import socket
+import signal
 import sys
+import os
 import logging
 import io
+import concurrent.futures
+import time
 
 from asterisk.agi import AGI
 
+# Import heavy modules in the parent so forked handlers share them copy-on-write
+# instead of importing them on first use in every child.
+from src.utils import logger
+from src.utils.intents import EXIT_KEYWORDS_RE, extract_order_number
+from src.ai import llm_client
+from src.data import data_fetcher
+from src.speech import tts, stt
+from src.speech.playback import play_llm_response
+from src.config import FASTAGI_WORKERS, RECORDING_DIR
+
+log = logger.setup_logger()
+
+WELCOME_MESSAGE = "Welcome to Zomato customer support. How can I assist you today?"
+
+SYSTEM_PROMPT = ("You are a female customer support executive working for zomato "
+                 "you are an expert at dealing with customers in food industry"
+                 "answer all their questions according to how a customer support would."
+                 "Keep in mind that you'll be in a call with the customer so Make sure you have a very nice and gentle tone when dealing with the customer"
+                 "also make sure to give very short and very concise and to the point answers"
+                 "don't use any special caracters or emojis or any brackets to express any additional emotions or actions"
+                 "Don't use any bullet points, numbers either, give your answer in a single line every time(you can make it 2 lines at most if needed)"
+                 "You're only allowed to answer stuff related to zomato and customer service, anything outside of this scope shall be avoided at all cost"
+                 "Lastly, for context regarding orders, you can not make up random order numbers, only order details given to you along with the user input as context is what you're allowed to use")
+
+# Sent as the first message of every request. It is the same for all calls, so
+# every request starts with an identical prefix the LLM service can cache;
+# per-call content (order details, turns) only ever follows it.
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+# Number of recent user/assistant exchanges sent to the LLM. Older turns are
+# dropped so the prompt (and per-turn latency) stays bounded on long calls.
+# Order details sit in the history where the order came up and are dropped with
+# their turn; the order is fetched again if the caller mentions it later.
+HISTORY_TURNS = 6
+# Exchanges dropped at once when the window is full. Evicting in blocks rather
+# than one exchange per turn keeps the start of the history unchanged for several
+# turns, so the LLM service's prefix cache stays warm between evictions.
+HISTORY_EVICT_TURNS = 3
+
+# Prompts whose audio does not depend on the conversation. They are synthesized
+# in the background at call start so they are ready by the time they're needed.
+STATIC_PROMPTS = {
+    "goodbye_noinput": "No input received. Ending session. Goodbye!",
+    "goodbye": "Thank you for contacting Zomato support. Have a great day!",
+}
+
 # --- Wrapper for your AGI main flow that uses a provided AGI instance ---
 def agi_main_flow_custom(agi):
     """
@@ -18,13 +69,6 @@ def agi_main_flow_custom(agi):
     It mirrors the logic in your existing agi_main_flow(), but is designed
     for FastAGI where AGI is constructed from the connection's I/O streams.
     """
-    from src.utils import logger
-    from src.ai import llm_client
-    from src.data import data_fetcher
-    from src.speech import tts, stt
-    import time, os, re
-
-    log = logger.setup_logger()
     agi.verbose("Starting FastAGI Voice Support Bot", level=1)
     
     # Get AGI environment from the connection.
@@ -33,37 +77,32 @@ def agi_main_flow_custom(agi):
     
     uniqueid = env.get("agi_uniqueid", "default")
     
+    # --- Prefetch static prompts while the caller is talking ---
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(STATIC_PROMPTS))
+    prefetched = {key: executor.submit(tts.get_cached_tts_file, text) for key, text in STATIC_PROMPTS.items()}
+    executor.shutdown(wait=False)
+    
     # --- Play Welcome Message ---
-    welcome_message = "Welcome to Zomato customer support. How can I assist you today?"
-    welcome_wav = f"/var/lib/asterisk/sounds/welcome_{uniqueid}.wav"
-    tts.generate_tts_file(welcome_message, welcome_wav)
+    welcome_sound = tts.get_cached_tts_file(WELCOME_MESSAGE)
     agi.verbose("Playing welcome message", level=1)
-    # Asterisk will search for a file named "welcome_<uniqueid>" (without extension)
-    agi.stream_file(f"welcome_{uniqueid}")
+    agi.stream_file(welcome_sound)
     
     # --- Initialize conversation history ---
-    system_prompt = ("You are a female customer support executive working for zomato "
-                     "you are an expert at dealing with customers in food industry"
-                     "answer all their questions according to how a customer support would."
-                     "Keep in mind that you'll be in a call with the customer so Make sure you have a very nice and gentle tone when dealing with the customer"
-                     "also make sure to give very short and very concise and to the point answers"
-                     "don't use any special caracters or emojis or any brackets to express any additional emotions or actions"
-                     "Don't use any bullet points, numbers either, give your answer in a single line every time(you can make it 2 lines at most if needed)"
-                     "You're only allowed to answer stuff related to zomato and customer service, anything outside of this scope shall be avoided at all cost"
-                     "Lastly, for context regarding orders, you can not make up random order numbers, only order details given to you along with the user input as context is what you're allowed to use")
-    conversation_history = [{"role": "system", "content": system_prompt}]
-    exit_keywords = ["bye", "exit", "quit", "end call", "goodbye", "thank you", "that's all"]
+    order_contexts = {}  # order number -> its context message in recent_turns
+    recent_turns = []
     
     # --- Main Conversation Loop ---
+    turn = 0
     while True:
+        turn += 1
         agi.verbose("Recording caller input", level=1)
-        input_filename = f"input_{uniqueid}"
-        input_wav = f"/var/lib/asterisk/sounds/{input_filename}.wav"
+        # Absolute path: Asterisk records straight into RECORDING_DIR
+        input_filename = f"{RECORDING_DIR}/input_{uniqueid}"
+        input_wav = f"{input_filename}.wav"
         
         agi.verbose("About to record caller input", level=1)
         agi.record_file(input_filename, format="wav", escape_digits="#", timeout=60000, offset=0, beep="beep", silence=5)
-        time.sleep(2)
-        if os.path.exists(input_wav):
+        if stt.wait_for_recording(input_wav):
             agi.verbose(f"Recording file exists: {input_wav}", level=1)
         else:
             agi.verbose(f"Recording file NOT found: {input_wav}", level=1)
@@ -71,58 +110,70 @@ def agi_main_flow_custom(agi):
         user_input = stt.recognize_from_file(input_wav)
         agi.verbose(f"STT returned: {user_input}", level=1)
         if not user_input:
-            goodbye_message = "No input received. Ending session. Goodbye!"
-            goodbye_wav = f"/var/lib/asterisk/sounds/goodbye_{uniqueid}.wav"
-            tts.generate_tts_file(goodbye_message, goodbye_wav)
+            goodbye_sound = prefetched["goodbye_noinput"].result()
             agi.verbose("Playing goodbye message", level=1)
-            agi.stream_file(f"goodbye_{uniqueid}")
+            agi.stream_file(goodbye_sound)
             break
         
         agi.verbose(f"User said: {user_input}", level=1)
-        conversation_history.append({"role": "user", "content": user_input})
+        recent_turns.append({"role": "user", "content": user_input})
         
-        if any(keyword in user_input.lower() for keyword in exit_keywords):
-            goodbye_message = "Thank you for contacting Zomato support. Have a great day!"
-            goodbye_wav = f"/var/lib/asterisk/sounds/goodbye_{uniqueid}.wav"
-            tts.generate_tts_file(goodbye_message, goodbye_wav)
+        if EXIT_KEYWORDS_RE.search(user_input):
+            goodbye_sound = prefetched["goodbye"].result()
             agi.verbose("Playing goodbye message", level=1)
-            agi.stream_file(f"goodbye_{uniqueid}")
+            agi.stream_file(goodbye_sound)
             break
         
         # --- Extract Order Number if Present ---
-        pattern = r'\b(?:order(?:\s*(?:id|number))?|id|number)?\s*(?:is|was|should be|supposed to be)?\s*[:#]?\s*(\d{3,10})'
-        match = re.search(pattern, user_input, re.IGNORECASE)
-        if match:
-            order_number = match.group(1)
+        order_number = extract_order_number(user_input)
+        if order_number in order_contexts:
+            # Each order is looked up once per call; repeats reuse its context.
+            agi.verbose(f"Order {order_number} already in context", level=1)
+        elif order_number:
             agi.verbose(f"Extracted order number: {order_number}", level=1)
             order_data = data_fetcher.fetch_order_data(order_number, source="csv")
             log.info("Fetched Order Data: %s", order_data)
             order_context = f"Order details for order {order_number}: {order_data}"
-            conversation_history.append({"role": "system", "content": order_context})
+            # Appended after the turn that mentioned it, so the history stays
+            # append-only and the cached request prefix is kept.
+            order_contexts[order_number] = {"role": "system", "content": order_context}
+            recent_turns.append(order_contexts[order_number])
         else:
             log.info("No order number found in input.")
         
-        # --- Query LLM for Response ---
-        ai_response = llm_client.query_llm(conversation_history)
-        clean_response = ai_response.replace("<|im_start|>assistant<|im_sep|>", "").replace("<|im_end|>", "").strip()
-        conversation_history.append({"role": "assistant", "content": clean_response})
-        agi.verbose(f"AI Response: {clean_response}", level=1)
-        
-        # --- Generate and Play AI Response ---
-        response_wav = f"/var/lib/asterisk/sounds/response_{uniqueid}.wav"
-        tts.generate_tts_file(clean_response, response_wav)
+        # --- Query LLM and play the response as it streams in ---
         agi.verbose("Playing AI response", level=1)
-        agi.stream_file(f"response_{uniqueid}")
+        conversation_history = [SYSTEM_MESSAGE, *recent_turns]
+        clean_response = play_llm_response(agi, conversation_history, f"response_{uniqueid}_{turn}")
+        recent_turns.append({"role": "assistant", "content": clean_response})
+        replies = [i for i, message in enumerate(recent_turns) if message["role"] == "assistant"]
+        if len(replies) > HISTORY_TURNS:
+            # Cut after a whole exchange; order details evicted with it are
+            # forgotten, so a later mention fetches them again.
+            evicted = recent_turns[:replies[HISTORY_EVICT_TURNS - 1] + 1]
+            del recent_turns[:len(evicted)]
+            for number, context in list(order_contexts.items()):
+                if any(context is message for message in evicted):
+                    del order_contexts[number]
+        agi.verbose(f"AI Response: {clean_response}", level=1)
     
     agi.hangup()
 
-# --- FastAGI Handler using Forking ---
+# --- FastAGI Handler ---
 class FastAGIHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        # AGI commands are short request/response lines; don't let Nagle hold them back.
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.request.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        super().setup()
+
     def handle(self):
         try:
             # Wrap the binary streams with TextIOWrapper so we work with text.
+            # Writes are buffered; AGI flushes once after each complete command line,
+            # so every command goes out as a single send.
             self.rfile = io.TextIOWrapper(self.rfile, encoding="utf-8")
-            self.wfile = io.TextIOWrapper(self.wfile, encoding="utf-8", write_through=True)
+            self.wfile = io.TextIOWrapper(self.wfile, encoding="utf-8")
             
             agi = AGI(stdin=self.rfile, stdout=self.wfile)
             self.server.logger.info("FastAGI request from %s", self.client_address)
@@ -130,9 +181,109 @@ class FastAGIHandler(socketserver.StreamRequestHandler):
         except Exception as e:
             self.server.logger.error("Exception in FastAGIHandler: %s", e)
 
-# Use ForkingTCPServer to handle each AGI connection in a separate process.
-class FastAGIServer(socketserver.ForkingTCPServer):
+# Each pre-forked worker (see serve_prefork) runs every call on its own thread, so
+# one process multiplexes many calls that mostly wait on Azure and Asterisk I/O.
+class FastAGIServer(socketserver.ThreadingTCPServer):
     allow_reuse_address = True
+    daemon_threads = True
+
+    def server_bind(self):
+        # Every worker binds its own listener on the same port and the kernel
+        # load-balances new connections across them, instead of all workers
+        # contending on a single accept queue.
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+# A worker that dies within WORKER_MIN_UPTIME seconds of starting counts as a
+# crash loop: its slot is restarted after an exponential backoff (capped at
+# WORKER_MAX_BACKOFF) and abandoned after WORKER_MAX_RAPID_FAILURES in a row.
+WORKER_MIN_UPTIME = 10
+WORKER_MAX_BACKOFF = 60
+WORKER_MAX_RAPID_FAILURES = 5
+# How often the parent checks for exited workers, in seconds.
+WORKER_POLL_INTERVAL = 0.5
+
+def prerender_prompts():
+    """
+    Renders the welcome message, the LLM fallback and the static prompts into the
+    TTS cache before any worker is forked, so even the first call after a restart
+    plays them from disk instead of waiting on synthesis.
+    Rendering happens in a short-lived child process, so the parent never loads
+    Speech SDK state that the workers would inherit across fork().
+    :return: True if every prompt was rendered.
+    """
+    pid = os.fork()
+    if pid == 0:
+        status = 0
+        try:
+            for text in (WELCOME_MESSAGE, llm_client.FALLBACK_RESPONSE, *STATIC_PROMPTS.values()):
+                tts.get_cached_tts_file(text)
+        except Exception:
+            log.exception("Pre-rendering prompts failed")
+            status = 1
+        finally:
+            logger.stop_listener()
+            os._exit(status)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status) == 0
+
+def _log_warmup_failure(future):
+    """Logs a background warmup that raised; its caller never reads the result."""
+    if future.exception() is not None:
+        log.exception("Warmup failed", exc_info=future.exception())
+
+def fork_worker(server_address, index, server_logger):
+    """
+    Forks one worker process serving calls from its own SO_REUSEPORT listener on
+    server_address. Modules imported above are already loaded, so no call pays
+    fork or import cost on its critical path.
+    :param server_address: (host, port) to listen on.
+    :param index: Worker slot, used to pick the CPU the worker is pinned to.
+    :param server_logger: Logger attached to the worker's server.
+    :return: PID of the worker.
+    """
+    pid = os.fork()
+    if pid == 0:
+        # The parent's SIGTERM handler is for shutting down the pool; a worker
+        # just exits.
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        # Spread workers across the available CPUs instead of letting them migrate.
+        if hasattr(os, "sched_setaffinity"):
+            cpus = sorted(os.sched_getaffinity(0))
+            os.sched_setaffinity(0, {cpus[index % len(cpus)]})
+        try:
+            server = FastAGIServer(server_address, FastAGIHandler)
+            server.logger = server_logger
+            # Connections don't survive fork, so each worker opens its own to the
+            # Azure services in the background before its first call arrives.
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=3)
+            for warmup in (llm_client.warmup, stt.warmup, tts.warmup):
+                executor.submit(warmup).add_done_callback(_log_warmup_failure)
+            executor.shutdown(wait=False)
+            server.serve_forever()
+        except KeyboardInterrupt:
+            status = 0
+        except Exception:
+            log.exception("FastAGI worker %s failed", os.getpid())
+            status = 1
+        else:
+            status = 0
+        finally:
+            # os._exit skips atexit, so flush queued log records (including
+            # the failure above) by hand.
+            logger.stop_listener()
+            os._exit(status)
+    return pid
+
+def serve_prefork(server_address, workers, server_logger):
+    """
+    Forks a fixed pool of worker processes (see fork_worker).
+    :param server_address: (host, port) to listen on.
+    :param workers: Number of worker processes to fork.
+    :param server_logger: Logger attached to each worker's server.
+    :return: Dict mapping worker PID to its slot index.
+    """
+    return {fork_worker(server_address, index, server_logger): index for index in range(workers)}
 
 if __name__ == "__main__":
     HOST, PORT = "0.0.0.0", 4577
@@ -143,11 +294,66 @@ if __name__ == "__main__":
     handler.setFormatter(formatter)
     logger_server.addHandler(handler)
     
-    server = FastAGIServer((HOST, PORT), FastAGIHandler)
-    server.logger = logger_server
-    logger_server.info(f"Starting FastAGI server on {HOST}:{PORT}")
+    # Give the call handlers a scheduling edge over other workloads when allowed.
+    try:
+        os.nice(-5)
+    except PermissionError:
+        logger_server.info("Insufficient permissions to raise server priority")
+    
+    logger_server.info("Pre-rendering static prompts")
+    if not prerender_prompts():
+        logger_server.warning("Some prompts were not pre-rendered; calls will synthesize them on first use")
+    
+    logger_server.info("Starting FastAGI server on %s:%s with %s workers", HOST, PORT, FASTAGI_WORKERS)
+    children = serve_prefork((HOST, PORT), FASTAGI_WORKERS, logger_server)
+    started = {index: time.monotonic() for index in children.values()}
+    rapid_failures = {}
+    restarts = {}  # slot index -> monotonic time its replacement worker is due
+    # SIGTERM (e.g. systemd stop) takes the same shutdown path as Ctrl-C, so no
+    # orphaned worker keeps holding the port.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     try:
-        server.serve_forever()
+        # Keep the pool at full size: a worker that dies is replaced in its slot,
+        # so the rest of the server never has to absorb its share of calls.
+        while children or restarts:
+            now = time.monotonic()
+            for index, due in list(restarts.items()):
+                if due <= now:
+                    del restarts[index]
+                    children[fork_worker((HOST, PORT), index, logger_server)] = index
+                    started[index] = time.monotonic()
+            pid, status = os.waitpid(-1, os.WNOHANG) if children else (0, 0)
+            if pid == 0:
+                # Nothing exited; poll again shortly, or when the next restart is due.
+                due = min(restarts.values(), default=now + WORKER_POLL_INTERVAL)
+                time.sleep(max(0, min(due - now, WORKER_POLL_INTERVAL)))
+                continue
+            index = children.pop(pid, None)
+            if index is None:
+                continue
+            exit_code = os.waitstatus_to_exitcode(status)
+            if time.monotonic() - started[index] < WORKER_MIN_UPTIME:
+                rapid_failures[index] = rapid_failures.get(index, 0) + 1
+            else:
+                rapid_failures[index] = 0
+            if rapid_failures[index] >= WORKER_MAX_RAPID_FAILURES:
+                logger_server.error("Worker slot %s failed %s times in a row, not restarting it",
+                                    index, rapid_failures[index])
+                continue
+            backoff = min(2 ** rapid_failures[index] - 1, WORKER_MAX_BACKOFF)
+            logger_server.warning("Worker %s exited with code %s, restarting in %ss", pid, exit_code, backoff)
+            restarts[index] = time.monotonic() + backoff
     except KeyboardInterrupt:
+        pass
+    finally:
         logger_server.info("FastAGI server shutting down")
-        server.shutdown()
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
@@ -1,49 +1,55 @@
 # src/main.py
 
-from src.speech import stt, tts
+from src.speech import stt, tts, playback
 from src.ai import llm_client
 from src.data import data_fetcher
-from src.utils import logger
-import re
-import spacy
+from src.utils import logger, intents
+from src.config import USE_SPACY_NER
+import concurrent.futures
+import functools
 
-# Load spaCy English model
-nlp = spacy.load("en_core_web_sm")
+log = logger.setup_logger()
+
+# spaCy NER is only a fallback for utterances the regex misses. It is off by
+# default: running the full pipeline on every turn costs far more than the regex.
+@functools.lru_cache(maxsize=1)
+def get_nlp():
+    """Loads the spaCy model on first use, so importing this module stays cheap."""
+    import spacy
+    # Load spaCy English model; only NER and the parser (for ent.root.head) are used
+    return spacy.load("en_core_web_sm", exclude=["tagger", "attribute_ruler", "lemmatizer"])
 
 def extract_order_number(text):
     """
-    Extracts order numbers from user input using NLP + regex.
+    Extracts order numbers from user input using regex, falling back to NLP
+    (when enabled) for utterances that contain digits the regex didn't catch.
     """
-    doc = nlp(text)
-    
-    # Try extracting numbers using NLP
+    order_number = intents.extract_order_number(text)
+    if order_number or not USE_SPACY_NER or not intents.DIGIT_RE.search(text):
+        return order_number
+
+    # Last resort: try extracting numbers using NLP
+    doc = get_nlp()(text)
     for ent in doc.ents:
         if ent.label_ == "CARDINAL":  # spaCy detects numbers as "CARDINAL"
             # Check if "order" or similar words appear near the number
             if any(token.text.lower() in ["order", "id", "number"] for token in ent.root.head.lefts):
-                print(f"[DEBUG] Extracted order number via NLP: {ent.text}")
+                log.debug("Extracted order number via NLP: %s", ent.text)
                 return ent.text
-
-    # Fallback: Use regex to catch missed cases
-    pattern = r'\b(?:order(?:\s*(?:id|number))?|id|number)?\s*(?:is|was|should be|supposed to be)?\s*[:#]?\s*(\d{3,10})'
-    match = re.search(pattern, text, re.IGNORECASE)
-    if match:
-        print(f"[DEBUG] Extracted order number via Regex: {match.group(1)}")
-        return match.group(1)
-
-    # Final fallback: If user ONLY says a number, assume it's an order ID
-    if text.strip().isdigit():
-        print(f"[DEBUG] Extracted standalone order number: {text.strip()}")
-        return text.strip()
-
-    print("[DEBUG] No order number found in the input.")
     return None
 
 
 def main_flow():
-    log = logger.setup_logger()
     log.info("Starting AI Voice Support Bot...")
 
+    # Warm up STT, the LLM connection and spaCy (if used) while the welcome message plays
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=3)
+    executor.submit(stt.warmup)
+    executor.submit(llm_client.warmup)
+    if USE_SPACY_NER:
+        executor.submit(get_nlp)
+    executor.shutdown(wait=False)
+
     # Play a welcome message when the user connects
     welcome_message = "Welcome to Zomato customer support. How can I assist you today?"
     tts.text_to_speech(welcome_message)
@@ -51,9 +57,8 @@ def main_flow():
     # Initialize conversation history with a system prompt for context
     system_prompt = "You are a female customer support executive working for zomato, you are an expert at dealing with customers in food industry, answer all their questions according to how a customer support would. Keep in mind that you'll be in a call with the customer so Make sure you have a very nice and gentle tone when dealing with the customer, And also make sure to give very short and very concise and to the point answers(don't use any special caracters or emojis or any brackets to express any additional emotions or actions)"
     conversation_history = [{"role": "system", "content": system_prompt}]
-
-    # Define exit keywords for ending the session
-    exit_keywords = ["bye", "exit", "quit", "end call", "end the call", "goodbye", "thank you", "that's all"]
+    # Orders already looked up this session; their details are in the history
+    fetched_orders = set()
 
     while True:
         # Wait for user input with a 30-second timeout
@@ -63,7 +68,7 @@ def main_flow():
             break
         
         # Check if any exit keyword is contained in the user input
-        if any(keyword in user_input.lower() for keyword in exit_keywords):
+        if intents.EXIT_KEYWORDS_RE.search(user_input):
             tts.text_to_speech("Thank you for contacting Zomato support. Have a great day!")
             break
         
@@ -72,29 +77,23 @@ def main_flow():
 
         # Check for an order number in the user input
         order_number = extract_order_number(user_input)
-        if order_number:
+        if order_number in fetched_orders:
+            log.info("Order %s already in context.", order_number)
+        elif order_number:
+            fetched_orders.add(order_number)
             order_data = data_fetcher.fetch_order_data(order_number, source="csv")
-            log.info(f"Fetched Order Data: {order_data}")
+            log.info("Fetched Order Data: %s", order_data)
             # Append a system message with order details as additional context
             order_context_message = f"Order details for order {order_number}: {order_data}"
             conversation_history.append({"role": "system", "content": order_context_message})
         else:
             log.info("No order number found in the input.")
         
-        # Query the LLM with the entire conversation history
-        ai_response = llm_client.query_llm(conversation_history)
-        
-        # Clean the response by removing unwanted formatting tokens
-        clean_response = (
-            ai_response
-            .replace("<|im_start|>assistant<|im_sep|>", "")
-            .replace("<|im_end|>", "")
-            .strip()
-        )
+        # Query the LLM and speak the answer sentence by sentence as it streams in
+        clean_response = playback.speak_llm_response(conversation_history)
         
         log.info("AI Response: %s", clean_response)
         conversation_history.append({"role": "assistant", "content": clean_response})
-        tts.text_to_speech(clean_response)
 
 if __name__ == "__main__":
     main_flow()
\ No newline at end of file
@@ -1,42 +1,221 @@
 # src/ai/llm_client.py
 
 import os
+import re
+import functools
+import threading
+import time
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
 from azure.ai.inference import ChatCompletionsClient
 from azure.ai.inference.models import SystemMessage, UserMessage, AssistantMessage
 from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import RequestsTransport
 from src.config import AZURE_INFERENCE_SDK_ENDPOINT, AZURE_INFERENCE_SDK_KEY, DEPLOYMENT_NAME
+from src.utils import logger
+
+log = logger.setup_logger()
+
+# One keep-alive HTTP session shared by every LLM call in the process. The pool is
+# sized so concurrent calls on a worker's threads each reuse a warm TLS connection
+# instead of opening a new one.
+HTTP_POOL_SIZE = 32
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE))
+
+# Fail fast on an unreachable endpoint instead of leaving the caller in silence;
+# the read timeout applies between received bytes, so long streamed answers are fine.
+LLM_CONNECT_TIMEOUT = 3
+LLM_READ_TIMEOUT = 30
 
 # Initialize the Azure AI Inference SDK Client
 client = ChatCompletionsClient(
     endpoint=AZURE_INFERENCE_SDK_ENDPOINT,
-    credential=AzureKeyCredential(AZURE_INFERENCE_SDK_KEY)
+    credential=AzureKeyCredential(AZURE_INFERENCE_SDK_KEY),
+    transport=RequestsTransport(
+        session=_session,
+        session_owner=False,
+        connection_timeout=LLM_CONNECT_TIMEOUT,
+        read_timeout=LLM_READ_TIMEOUT
+    ),
+    # The SDK's retry policy already backs off and honours Retry-After on 429/5xx;
+    # its defaults allow minutes of retrying, far too long for a caller on the line.
+    retry_total=2,
+    retry_backoff_factor=0.2,
+    retry_backoff_max=2
 )
 
+FALLBACK_RESPONSE = "Sorry, I encountered an issue processing your request."
+
+# Circuit breaker: after LLM_BREAKER_FAILURES consecutive failed requests, calls
+# return FALLBACK_RESPONSE immediately for LLM_BREAKER_COOLDOWN seconds instead of
+# every caller waiting out timeouts and retries against an endpoint that is down.
+LLM_BREAKER_FAILURES = 5
+LLM_BREAKER_COOLDOWN = 30
+_consecutive_failures = 0
+_breaker_open_until = 0.0
+_breaker_lock = threading.Lock()
+
+# In-process LRU of answers keyed by the normalized conversation. Callers asking the
+# same question with the same context (e.g. the first turn about a given order)
+# get the cached answer without another round-trip to Azure.
+RESPONSE_CACHE_SIZE = 256
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+# Azure AI Inference message class for each supported role.
+_MESSAGE_TYPES = {"system": SystemMessage, "user": UserMessage, "assistant": AssistantMessage}
+
+@functools.lru_cache(maxsize=4096)
+def _prepare_message(role, content):
+    """
+    Normalizes one message for the cache key and converts it to its Azure AI
+    Inference message object. Memoized, so the earlier turns that every request
+    resends are only processed once rather than on every turn.
+    :return: (cache key part, message object or None for an unknown role).
+    """
+    role = role.lower()
+    message_type = _MESSAGE_TYPES.get(role)
+    message = message_type(content=content) if message_type else None
+    return (role, " ".join(content.lower().split())), message
+
+def _prepare(conversation_history):
+    return [_prepare_message(msg.get("role"), msg.get("content")) for msg in conversation_history]
+
+def _cache_key(prepared, max_tokens):
+    """Builds a cache key that ignores case and whitespace differences in message content."""
+    return (max_tokens,) + tuple(key for key, _ in prepared)
+
+def _to_messages(prepared):
+    """Returns the Azure AI Inference message objects of prepared messages."""
+    return [message for _, message in prepared if message is not None]
+
+def _cache_response(key, content):
+    with _response_cache_lock:
+        _response_cache[key] = content
+        if len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+# Conversation history contract for callers of query_llm/stream_llm. The service
+# can reuse its prompt cache for whatever prefix a request shares with earlier
+# ones, so within a call:
+#   - the system prompt comes first and is byte-identical on every request;
+#   - history is append-only: earlier messages are never edited or reordered;
+#   - if old turns must be dropped, drop several at once rather than one per turn.
+
+# Chat-template tokens the model sometimes echoes back in its answer.
+_TEMPLATE_TOKEN_RE = re.compile(r"<\|im_start\|>assistant<\|im_sep\|>|<\|im_end\|>")
+
+def _breaker_open():
+    return time.monotonic() < _breaker_open_until
+
+def _record_outcome(ok):
+    """Tracks consecutive failures and opens the circuit breaker when they pile up."""
+    global _consecutive_failures, _breaker_open_until
+    with _breaker_lock:
+        if ok:
+            _consecutive_failures = 0
+            return
+        _consecutive_failures += 1
+        if _consecutive_failures >= LLM_BREAKER_FAILURES:
+            _consecutive_failures = 0
+            _breaker_open_until = time.monotonic() + LLM_BREAKER_COOLDOWN
+            log.warning("LLM circuit breaker open for %ss", LLM_BREAKER_COOLDOWN)
+
+def clean_llm_response(text):
+    """
+    Strips echoed chat-template tokens from an LLM answer in a single pass.
+    :param text: Raw answer text.
+    :return: The answer without template tokens or surrounding whitespace.
+    """
+    return _TEMPLATE_TOKEN_RE.sub("", text).strip()
+
 def query_llm(conversation_history, max_tokens=1000):
     """
     Queries the Azure-hosted LLM with the entire conversation history.
     The conversation_history should include messages with roles: system, user, and assistant.
+    Answers are cached per conversation, so an identical conversation is served locally.
     """
-    messages = []
-    for msg in conversation_history:
-        role = msg.get("role").lower()
-        content = msg.get("content")
-        if role == "system":
-            messages.append(SystemMessage(content=content))
-        elif role == "user":
-            messages.append(UserMessage(content=content))
-        elif role == "assistant":
-            messages.append(AssistantMessage(content=content))
+    prepared = _prepare(conversation_history)
+    key = _cache_key(prepared, max_tokens)
+    with _response_cache_lock:
+        if key in _response_cache:
+            _response_cache.move_to_end(key)
+            return _response_cache[key]
+    if _breaker_open():
+        return FALLBACK_RESPONSE
+
     try:
         response = client.complete(
-            messages=messages,
+            messages=_to_messages(prepared),
             model=DEPLOYMENT_NAME,
             max_tokens=max_tokens
         )
-        return response.choices[0].message.content
+        content = response.choices[0].message.content
+    except Exception as e:
+        log.error("LLM Error: %s", e)
+        _record_outcome(False)
+        return FALLBACK_RESPONSE
+
+    _record_outcome(True)
+    _cache_response(key, content)
+    return content
+
+def stream_llm(conversation_history, max_tokens=1000):
+    """
+    Same as query_llm, but yields the answer in chunks as the model generates them,
+    so callers can start speaking before the full answer is ready.
+    A cached answer is yielded as a single chunk.
+    """
+    prepared = _prepare(conversation_history)
+    key = _cache_key(prepared, max_tokens)
+    with _response_cache_lock:
+        cached = _response_cache.get(key)
+        if cached is not None:
+            _response_cache.move_to_end(key)
+    # Yield outside the lock; the caller may hold this generator suspended while
+    # it plays the answer.
+    if cached is not None:
+        yield cached
+        return
+    if _breaker_open():
+        yield FALLBACK_RESPONSE
+        return
+
+    chunks = []
+    try:
+        response = client.complete(
+            messages=_to_messages(prepared),
+            model=DEPLOYMENT_NAME,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        for update in response:
+            if update.choices and update.choices[0].delta.content:
+                chunks.append(update.choices[0].delta.content)
+                yield update.choices[0].delta.content
+    except Exception as e:
+        log.error("LLM Error: %s", e)
+        _record_outcome(False)
+        if not chunks:
+            yield FALLBACK_RESPONSE
+        return
+
+    _record_outcome(True)
+    _cache_response(key, "".join(chunks))
+
+def warmup():
+    """
+    Opens the pooled HTTPS connection (DNS, TCP and TLS) to the endpoint, so it
+    is already open when the first real question arrives. It sends an
+    unauthenticated HEAD, which generates (and bills) no tokens; any HTTP status
+    leaves the connection in the pool. Failures are only logged.
+    """
+    try:
+        _session.head(AZURE_INFERENCE_SDK_ENDPOINT, timeout=(LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT))
     except Exception as e:
-        print(f"LLM Error: {e}")
-        return "Sorry, I encountered an issue processing your request."
+        log.warning("LLM warmup failed: %s", e)
 
 if __name__ == "__main__":
     # Quick test
@@ -11,8 +11,19 @@ AZURE_SPEECH_KEY = os.getenv("AZURE_SPEECH_KEY")
 AZURE_SPEECH_REGION = os.getenv("AZURE_SPEECH_REGION")
 AZURE_TTS_VOICE = os.getenv("AZURE_TTS_VOICE", "en-IN-AashiNeural")  # Default to Indian English
 AZURE_STT_LANGUAGE = os.getenv("AZURE_STT_LANGUAGE", "en-IN")  # Default to Indian English
+AZURE_STT_SEGMENTATION_SILENCE_MS = os.getenv("AZURE_STT_SEGMENTATION_SILENCE_MS")  # End-of-utterance silence; service default if unset
+AZURE_STT_FAST_TRANSCRIPTION = os.getenv("AZURE_STT_FAST_TRANSCRIPTION", "false").lower() in ("1", "true", "yes")  # Transcribe recordings via the Fast Transcription REST API
+SOUNDS_DIR = os.getenv("ASTERISK_SOUNDS_DIR", "/var/lib/asterisk/sounds")  # Relative names in stream_file/record_file resolve here
+RECORDING_DIR = os.getenv("RECORDING_DIR", SOUNDS_DIR)  # Caller recordings; point at tmpfs (e.g. /dev/shm) when shared with Asterisk
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "/var/lib/asterisk/sounds/_ttscache")  # Cached static prompts
 
 # Azure LLM (Inference SDK) Config
 AZURE_INFERENCE_SDK_ENDPOINT = os.getenv("AZURE_INFERENCE_SDK_ENDPOINT")
 AZURE_INFERENCE_SDK_KEY = os.getenv("AZURE_INFERENCE_SDK_KEY")
-DEPLOYMENT_NAME = os.getenv("DEPLOYMENT_NAME")
\ No newline at end of file
+DEPLOYMENT_NAME = os.getenv("DEPLOYMENT_NAME")
+
+# FastAGI Server Config
+FASTAGI_WORKERS = int(os.getenv("FASTAGI_WORKERS", os.cpu_count() or 1))  # Pre-forked worker processes
+
+# Order-number extraction (main.py)
+USE_SPACY_NER = os.getenv("USE_SPACY_NER", "false").lower() in ("1", "true", "yes")  # spaCy fallback after the regex
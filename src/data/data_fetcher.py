@@ -2,12 +2,42 @@
 
 import os
 import csv
+import threading
+import time
+from collections import OrderedDict
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Configurable CSV file path and API endpoint (set these in your .env file)
 CSV_FILE_PATH = os.getenv("ORDER_DATA_CSV", "src/data/data.csv")
 ORDER_API_ENDPOINT = os.getenv("ORDER_API_ENDPOINT", "https://api.example.com/order")
 
+# Keep-alive session for order API calls, so repeat lookups reuse a warm TLS
+# connection. Transient gateway errors are retried with a short backoff, and the
+# timeout keeps a stalled API from holding the caller in silence.
+API_TIMEOUT = (1.0, 5.0)  # (connect, read) seconds
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(
+    pool_maxsize=16,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504], raise_on_status=False)
+))
+
+# Short-lived LRU of successful API lookups, shared by all calls in the process.
+# Order status changes, so entries expire after API_CACHE_TTL seconds.
+API_CACHE_SIZE = 1024
+API_CACHE_TTL = 60
+_api_cache = OrderedDict()
+_api_cache_lock = threading.Lock()
+
+# Rows of CSV_FILE_PATH keyed by order_id, kept as raw lists next to the header;
+# a row only becomes a dict when it is looked up. Built on first lookup and rebuilt
+# only when the file's mtime changes, so a lookup is a dict hit instead of a file scan.
+_order_header = []
+_order_index = {}
+_order_index_mtime = None
+_order_index_lock = threading.Lock()
+
 def fetch_order_data(order_id, source="csv"):
     """
     Fetch order data either from a CSV file (for testing) or from an API.
@@ -22,24 +52,54 @@ def fetch_order_data(order_id, source="csv"):
     else:
         return {"error": "Invalid data source specified"}
 
+def _load_order_index():
+    """Returns (header, index), re-reading the CSV only if it changed since the last load."""
+    global _order_header, _order_index, _order_index_mtime
+    mtime = os.stat(CSV_FILE_PATH).st_mtime
+    if mtime != _order_index_mtime:
+        with _order_index_lock:
+            if mtime != _order_index_mtime:
+                index = {}
+                with open(CSV_FILE_PATH, mode="r", encoding="utf-8", newline="", buffering=1 << 20) as file:
+                    reader = csv.reader(file)
+                    header = next(reader, [])
+                    key = header.index("order_id")
+                    for row in reader:
+                        # First row wins, as with the original top-down scan.
+                        if len(row) > key:
+                            index.setdefault(row[key], row)
+                _order_header, _order_index, _order_index_mtime = header, index, mtime
+    return _order_header, _order_index
+
 def fetch_from_csv(order_id):
-    """Reads order data from a CSV file based on order_id."""
+    """Looks up order data from the CSV file based on order_id."""
     try:
-        with open(CSV_FILE_PATH, mode="r", encoding="utf-8") as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if row.get("order_id") == order_id:
-                    return row  # Return the matched order data
-        return {"error": "Order not found"}
+        header, index = _load_order_index()
+        row = index.get(order_id)
+        if row is None:
+            return {"error": "Order not found"}
+        return dict(zip(header, row))
     except Exception as e:
         return {"error": f"Error reading CSV: {str(e)}"}
 
 def fetch_from_api(order_id):
-    """Calls an external API to fetch order data."""
+    """Calls an external API to fetch order data, reusing answers younger than API_CACHE_TTL."""
+    now = time.monotonic()
+    with _api_cache_lock:
+        cached = _api_cache.get(order_id)
+        if cached and cached[0] > now:
+            _api_cache.move_to_end(order_id)
+            return cached[1]
     try:
-        response = requests.get(f"{ORDER_API_ENDPOINT}/{order_id}")
+        response = _session.get(f"{ORDER_API_ENDPOINT}/{order_id}", timeout=API_TIMEOUT)
         if response.status_code == 200:
-            return response.json()
+            data = response.json()
+            with _api_cache_lock:
+                _api_cache[order_id] = (now + API_CACHE_TTL, data)
+                _api_cache.move_to_end(order_id)
+                if len(_api_cache) > API_CACHE_SIZE:
+                    _api_cache.popitem(last=False)
+            return data
         return {"error": f"API request failed with status code {response.status_code}"}
     except Exception as e:
         return {"error": f"API request error: {str(e)}"}
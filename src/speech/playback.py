@@ -0,0 +1,140 @@
+# src/speech/playback.py
+
+import contextlib
+import os
+import queue
+import re
+import threading
+
+from src.ai import llm_client
+from src.speech import tts
+from src.config import SOUNDS_DIR
+from src.utils import logger
+
+log = logger.setup_logger()
+
+# Splits streamed LLM output after sentence-ending punctuation.
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+# A run-on answer without punctuation is flushed to TTS once it reaches this
+# many words, so the first audio is not held back until the very end.
+MAX_CHUNK_WORDS = 20
+
+# Spoken answers are one or two short sentences (see the system prompts), so a
+# small completion budget is plenty and keeps provider-side scheduling cheap.
+RESPONSE_MAX_TOKENS = 200
+
+def iter_sentences(chunks, collected):
+    """
+    Regroups streamed LLM text into cleaned sentences as soon as each is complete.
+    :param chunks: Iterable of text chunks as they arrive.
+    :param collected: List every raw chunk is appended to, for the full answer.
+    :return: Generator of non-empty sentences, in order.
+    """
+    buffer = ""
+    for chunk in chunks:
+        collected.append(chunk)
+        *sentences, buffer = SENTENCE_END_RE.split(buffer + chunk)
+        if len(buffer.split()) > MAX_CHUNK_WORDS:
+            # Keep the trailing (possibly partial) word for the next chunk.
+            head, _, buffer = buffer.rpartition(" ")
+            sentences.append(head)
+        for sentence in sentences:
+            sentence = llm_client.clean_llm_response(sentence)
+            if sentence:
+                yield sentence
+    buffer = llm_client.clean_llm_response(buffer)
+    if buffer:
+        yield buffer
+
+def play_llm_response(agi, conversation_history, basename):
+    """
+    Streams the LLM answer and plays it sentence by sentence. A background thread
+    synthesizes each sentence as soon as it is complete, while earlier sentences
+    are already playing, so the caller hears audio before the full answer exists.
+    :param agi: AGI instance used for playback.
+    :param conversation_history: Messages to send to the LLM.
+    :param basename: Sound file base name; sentence files are <basename>_<n>.
+                     Each file is removed once it has been played, or
+                     discarded if playback fails.
+    :return: The full cleaned response text, or the fallback response if nothing
+             could be played.
+    """
+    sounds = queue.Queue()
+    chunks = []
+    stop = threading.Event()
+
+    def produce():
+        try:
+            stream = llm_client.stream_llm(conversation_history, max_tokens=RESPONSE_MAX_TOKENS)
+            sentences = iter_sentences(stream, chunks)
+            for index, sentence in enumerate(sentences):
+                if stop.is_set():
+                    break
+                if tts.generate_tts_file(sentence, f"{SOUNDS_DIR}/{basename}_{index}"):
+                    sounds.put(f"{basename}_{index}")
+        except Exception:
+            log.exception("Failed to produce LLM response audio")
+        finally:
+            sounds.put(None)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    sound = None
+    played = 0
+    try:
+        while (sound := sounds.get()) is not None:
+            played += 1
+            try:
+                agi.stream_file(sound)
+            finally:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(f"{SOUNDS_DIR}/{sound}.ulaw")
+    finally:
+        if sound is not None:
+            # Playback failed (e.g. the caller hung up): stop synthesizing and
+            # delete the sentences that will never be played.
+            stop.set()
+            while (sound := sounds.get()) is not None:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(f"{SOUNDS_DIR}/{sound}.ulaw")
+    producer.join()
+    if not played:
+        # Nothing could be played (LLM or TTS failure): tell the caller instead
+        # of leaving them in silence.
+        agi.stream_file(tts.get_cached_tts_file(llm_client.FALLBACK_RESPONSE))
+        return llm_client.FALLBACK_RESPONSE
+    return llm_client.clean_llm_response("".join(chunks))
+
+def speak_llm_response(conversation_history):
+    """
+    Same as play_llm_response, but speaks through the default speaker (main.py).
+    The answer keeps streaming in on a background thread while earlier
+    sentences are being spoken.
+    :param conversation_history: Messages to send to the LLM.
+    :return: The full cleaned response text.
+    """
+    sentences = queue.Queue()
+    chunks = []
+
+    def produce():
+        try:
+            stream = llm_client.stream_llm(conversation_history, max_tokens=RESPONSE_MAX_TOKENS)
+            for sentence in iter_sentences(stream, chunks):
+                sentences.put(sentence)
+        except Exception:
+            log.exception("Failed to produce LLM response text")
+        finally:
+            sentences.put(None)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    spoken = 0
+    while (sentence := sentences.get()) is not None:
+        spoken += 1
+        tts.text_to_speech(sentence)
+    producer.join()
+    if not spoken:
+        tts.text_to_speech(llm_client.FALLBACK_RESPONSE)
+        return llm_client.FALLBACK_RESPONSE
+    return llm_client.clean_llm_response("".join(chunks))
@@ -1,6 +1,97 @@
 #/src/speech/stt.py
+import os
+import time
+import functools
+import queue
+import json
+import requests
 import azure.cognitiveservices.speech as speechsdk
-from src.config import AZURE_SPEECH_KEY, AZURE_SPEECH_REGION, AZURE_STT_LANGUAGE
+from src.config import AZURE_SPEECH_KEY, AZURE_SPEECH_REGION, AZURE_STT_LANGUAGE, AZURE_STT_SEGMENTATION_SILENCE_MS, AZURE_STT_FAST_TRANSCRIPTION
+from src.utils import logger
+
+log = logger.setup_logger()
+
+# Fast Transcription returns as soon as the whole file is processed, instead of
+# pacing the recording through a real-time recognition session.
+FAST_TRANSCRIPTION_URL = "https://{region}.api.cognitive.microsoft.com/speechtotext/transcriptions:transcribe?api-version=2024-11-15"
+FAST_TRANSCRIPTION_TIMEOUT = (2.0, 15.0)  # (connect, read) seconds
+_session = requests.Session()
+
+# Final results from the live-microphone recognizer, put here by its SDK
+# callbacks while speech_to_text is listening.
+_microphone_results = queue.Queue()
+
+@functools.lru_cache(maxsize=1)
+def _speech_config():
+    """
+    Builds the SpeechConfig for recognition once per process; recognizers copy
+    it at construction, so every call can share it.
+    A shorter segmentation silence timeout makes the service finalize an
+    utterance sooner after the caller stops.
+    """
+    speech_config = speechsdk.SpeechConfig(subscription=AZURE_SPEECH_KEY, region=AZURE_SPEECH_REGION)
+    if AZURE_STT_SEGMENTATION_SILENCE_MS:
+        speech_config.set_property(speechsdk.PropertyId.Speech_SegmentationSilenceTimeoutMs,
+                                   AZURE_STT_SEGMENTATION_SILENCE_MS)
+    return speech_config
+
+@functools.lru_cache(maxsize=1)
+def _microphone_recognizer():
+    """
+    Builds the live-microphone recognizer once and opens its connection, so
+    later utterances reuse the same service connection. Recognition runs in
+    continuous mode, which unlike recognize_once can be stopped on a timeout.
+    """
+    speech_recognizer = speechsdk.SpeechRecognizer(speech_config=_speech_config(), language=AZURE_STT_LANGUAGE)
+    speech_recognizer.recognized.connect(lambda evt: _microphone_results.put(evt.result))
+    speech_recognizer.canceled.connect(lambda evt: _microphone_results.put(evt.result))
+    speechsdk.Connection.from_recognizer(speech_recognizer).open(True)
+    return speech_recognizer
+
+def wait_for_recording(audio_file, timeout=1.0, interval=0.05):
+    """
+    Waits until a recording has audio beyond its WAV header.
+    AGI record_file only returns once Asterisk has closed the file, so this
+    normally succeeds on the first stat; the retries only cover a slow filesystem.
+    :param audio_file: Full path to the recorded WAV file.
+    :return: True if the recording exists and is non-empty, False on timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if os.stat(audio_file).st_size > 44:
+                return True
+        except FileNotFoundError:
+            pass
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval)
+
+def warmup():
+    """
+    Loads the Speech SDK and builds the shared SpeechConfig ahead of the first
+    recognition. Each recording gets its own recognizer, so there is no
+    connection that could be opened in advance.
+    """
+    _speech_config()
+
+def _fast_transcribe(audio_file, language):
+    """
+    Transcribes a recording with the Fast Transcription REST API.
+    :param audio_file: Full path to the WAV file to be transcribed.
+    :param language: Locale of the speech, e.g. "en-IN".
+    :return: Transcribed text or None if nothing was recognized.
+    """
+    with open(audio_file, "rb") as audio:
+        response = _session.post(
+            FAST_TRANSCRIPTION_URL.format(region=AZURE_SPEECH_REGION),
+            headers={"Ocp-Apim-Subscription-Key": AZURE_SPEECH_KEY},
+            files={"audio": audio, "definition": (None, json.dumps({"locales": [language]}))},
+            timeout=FAST_TRANSCRIPTION_TIMEOUT,
+        )
+    response.raise_for_status()
+    phrases = response.json().get("combinedPhrases") or []
+    return (phrases[0].get("text") if phrases else None) or None
 
 def recognize_from_file(audio_file):
     """
@@ -8,59 +99,71 @@ def recognize_from_file(audio_file):
     :param audio_file: Full path to the WAV file to be transcribed.
     :return: Transcribed text or None if recognition fails.
     """
-    speech_config = speechsdk.SpeechConfig(subscription=AZURE_SPEECH_KEY, region=AZURE_SPEECH_REGION)
+    speech_config = _speech_config()
     # Use the configured language from your config or hard-code (e.g., "en-IN")
     language = AZURE_STT_LANGUAGE if AZURE_STT_LANGUAGE else "en-IN"
+    if AZURE_STT_FAST_TRANSCRIPTION:
+        try:
+            text = _fast_transcribe(audio_file, language)
+            if text:
+                log.info("Recognized from file: %s", text)
+            else:
+                log.warning("No speech recognized from file.")
+            return text
+        except (requests.RequestException, ValueError, OSError) as e:
+            log.error("Fast transcription failed, falling back to real-time recognition: %s", e)
     audio_config = speechsdk.audio.AudioConfig(filename=audio_file)
     speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, language=language, audio_config=audio_config)
     
     result = speech_recognizer.recognize_once()
     if result.reason == speechsdk.ResultReason.RecognizedSpeech:
-        print(f"[INFO] Recognized from file: {result.text}")
+        log.info("Recognized from file: %s", result.text)
         return result.text
     elif result.reason == speechsdk.ResultReason.NoMatch:
-        print("[WARNING] No speech recognized from file.")
+        log.warning("No speech recognized from file.")
         return None
     elif result.reason == speechsdk.ResultReason.Canceled:
         cancellation_details = result.cancellation_details
-        print(f"[ERROR] Speech recognition canceled: {cancellation_details.reason}")
+        log.error("Speech recognition canceled: %s", cancellation_details.reason)
         if cancellation_details.reason == speechsdk.CancellationReason.Error:
-            print(f"Error details: {cancellation_details.error_details}")
+            log.error("Error details: %s", cancellation_details.error_details)
         return None
 
 def speech_to_text(timeout=30):
     """
     Listens for user speech live and returns the recognized text.
     (This is the original live STT function.)
+    Listening stops before returning, also on timeout, so no recognition
+    outlives the call.
     """
-    import concurrent.futures
-
-    def _recognize_once():
-        speech_config = speechsdk.SpeechConfig(subscription=AZURE_SPEECH_KEY, region=AZURE_SPEECH_REGION)
-        # Here you can use AZURE_STT_LANGUAGE or a hardcoded language
-        speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, language=AZURE_STT_LANGUAGE)
-        print(f"Say something... (Listening in {AZURE_STT_LANGUAGE})")
-        result = speech_recognizer.recognize_once()
-        if result.reason == speechsdk.ResultReason.RecognizedSpeech:
-            print(f"[INFO] Recognized: {result.text}")
-            return result.text
-        elif result.reason == speechsdk.ResultReason.NoMatch:
-            print("[WARNING] No speech recognized.")
-            return None
-        elif result.reason == speechsdk.ResultReason.Canceled:
-            cancellation_details = result.cancellation_details
-            print(f"[ERROR] Speech recognition canceled: {cancellation_details.reason}")
-            if cancellation_details.reason == speechsdk.CancellationReason.Error:
-                print(f"Error details: {cancellation_details.error_details}")
-            return None
+    speech_recognizer = _microphone_recognizer()
+    # Drop results that arrived after the previous call stopped listening.
+    while not _microphone_results.empty():
+        _microphone_results.get_nowait()
+    print(f"Say something... (Listening in {AZURE_STT_LANGUAGE})")
+    deadline = time.monotonic() + timeout
+    speech_recognizer.start_continuous_recognition()
+    try:
+        while True:
+            result = _microphone_results.get(timeout=max(0, deadline - time.monotonic()))
+            if result.reason != speechsdk.ResultReason.NoMatch:
+                break
+            log.warning("No speech recognized.")
+    except queue.Empty:
+        log.warning("No speech input for %s seconds.", timeout)
+        return None
+    finally:
+        speech_recognizer.stop_continuous_recognition()
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future = executor.submit(_recognize_once)
-        try:
-            return future.result(timeout=timeout)
-        except concurrent.futures.TimeoutError:
-            print("[WARNING] No speech input for 30 seconds.")
-            return None
+    if result.reason == speechsdk.ResultReason.RecognizedSpeech:
+        log.info("Recognized: %s", result.text)
+        return result.text
+    elif result.reason == speechsdk.ResultReason.Canceled:
+        cancellation_details = result.cancellation_details
+        log.error("Speech recognition canceled: %s", cancellation_details.reason)
+        if cancellation_details.reason == speechsdk.CancellationReason.Error:
+            log.error("Error details: %s", cancellation_details.error_details)
+        return None
 
 if __name__ == "__main__":
     # For testing: use a local file for recognition
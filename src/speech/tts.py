@@ -1,61 +1,152 @@
 #/src/speech/tts.py
 import azure.cognitiveservices.speech as speechsdk
-import subprocess
 import os
-from src.config import AZURE_SPEECH_KEY, AZURE_SPEECH_REGION, AZURE_TTS_VOICE
+import hashlib
+import threading
+import queue
+import functools
+from src.config import AZURE_SPEECH_KEY, AZURE_SPEECH_REGION, AZURE_TTS_VOICE, TTS_CACHE_DIR
+from src.utils import logger
 
-def text_to_speech(text):
+log = logger.setup_logger()
+
+# Idle file-rendering synthesizers. Each keeps its service connection open
+# between uses, so only the first synthesis on a synthesizer pays the handshake.
+TTS_POOL_SIZE = 3
+_synthesizer_pool = queue.LifoQueue()
+
+# Headerless 8 kHz mu-law is exactly what Asterisk plays from a .ulaw file.
+FILE_OUTPUT_FORMAT = speechsdk.SpeechSynthesisOutputFormat.Raw8Khz8BitMonoMULaw
+
+@functools.lru_cache(maxsize=2)
+def _speech_config(output_format=None):
     """
-    Converts text to speech using Azure TTS and plays via default speaker.
+    Builds the SpeechConfig for synthesis once per process and output format.
+    :param output_format: SpeechSynthesisOutputFormat to request, or None for the SDK default.
     """
     speech_config = speechsdk.SpeechConfig(subscription=AZURE_SPEECH_KEY, region=AZURE_SPEECH_REGION)
-    # Choose your voice
     speech_config.speech_synthesis_voice_name = AZURE_TTS_VOICE or "en-IN-NeerjaNeural"
+    if output_format is not None:
+        speech_config.set_speech_synthesis_output_format(output_format)
+    return speech_config
+
+def _acquire_synthesizer():
+    """
+    Takes an idle synthesizer from the pool, creating one if none is free.
+    """
+    try:
+        return _synthesizer_pool.get_nowait()
+    except queue.Empty:
+        return speechsdk.SpeechSynthesizer(speech_config=_speech_config(FILE_OUTPUT_FORMAT), audio_config=None)
+
+def _release_synthesizer(synthesizer):
+    """
+    Returns a synthesizer to the pool; extras beyond TTS_POOL_SIZE are dropped.
+    """
+    if _synthesizer_pool.qsize() < TTS_POOL_SIZE:
+        _synthesizer_pool.put(synthesizer)
+
+@functools.lru_cache(maxsize=1)
+def _speaker_synthesizer():
+    """
+    Builds the default-speaker synthesizer once, so text_to_speech keeps one
+    warm service connection across sentences.
+    """
     audio_config = speechsdk.audio.AudioOutputConfig(use_default_speaker=True)
-    synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
-    result = synthesizer.speak_text_async(text).get()
+    return speechsdk.SpeechSynthesizer(speech_config=_speech_config(), audio_config=audio_config)
+
+# Serializes text_to_speech; one synthesizer drives one speaker.
+_speaker_lock = threading.Lock()
+
+def _reset_after_fork():
+    """
+    Drops synthesizers and SpeechConfigs inherited from the parent process;
+    native SDK state, threads and connections do not survive fork(), so each
+    child builds its own.
+    """
+    global _synthesizer_pool, _speaker_lock
+    _synthesizer_pool = queue.LifoQueue()
+    _speaker_lock = threading.Lock()
+    _speaker_synthesizer.cache_clear()
+    _speech_config.cache_clear()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def text_to_speech(text):
+    """
+    Converts text to speech using Azure TTS and plays via default speaker.
+    """
+    with _speaker_lock:
+        result = _speaker_synthesizer().speak_text_async(text).get()
     if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-        print(f"[INFO] Synthesized speech: {text}")
+        log.info("Synthesized speech: %s", text)
     elif result.reason == speechsdk.ResultReason.Canceled:
         cancellation_details = result.cancellation_details
-        print("[ERROR] Speech synthesis canceled:", cancellation_details.reason)
+        log.error("Speech synthesis canceled: %s", cancellation_details.reason)
 
-def generate_tts_file(text, output_file):
+def generate_tts_file(text, sound_file):
     """
-    Converts text to speech using Azure TTS and saves the audio output as a WAV file.
-    Then it converts the WAV file to mu-law (ulaw) format using ffmpeg.
+    Converts text to speech using Azure TTS and saves it as a mu-law (ulaw) file.
+    
+    The service renders 8 kHz mu-law directly, so no conversion step is needed.
+    The file is written under a temporary name and renamed into place atomically,
+    so Asterisk never reads a half-written file.
     
     :param text: Text to be synthesized.
-    :param output_file: Full path for the generated WAV file (e.g., /var/lib/asterisk/sounds/response.wav).
-                        The final file will be saved as the same base name with a .ulaw extension.
+    :param sound_file: Full path without extension (e.g., /var/lib/asterisk/sounds/response),
+                       as passed to agi.stream_file. The audio is saved as <sound_file>.ulaw.
+    :return: True if the file was written, False if synthesis was canceled.
     """
-    # Generate the WAV file using Azure TTS
-    speech_config = speechsdk.SpeechConfig(subscription=AZURE_SPEECH_KEY, region=AZURE_SPEECH_REGION)
-    speech_config.speech_synthesis_voice_name = AZURE_TTS_VOICE or "en-IN-NeerjaNeural"
-    # Do not set an output format here since we'll do conversion with ffmpeg.
-    audio_config = speechsdk.audio.AudioOutputConfig(filename=output_file)
-    synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
-    
+    final_file = sound_file + ".ulaw"
+    # Generate the audio using a pooled synthesizer
+    synthesizer = _acquire_synthesizer()
     result = synthesizer.speak_text_async(text).get()
+    # A canceled synthesis usually means a broken connection; let that
+    # synthesizer go so the next call builds a fresh one.
+    if result.reason != speechsdk.ResultReason.Canceled:
+        _release_synthesizer(synthesizer)
     if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-        print(f"[INFO] Generated TTS WAV file at: {output_file}")
-        # Convert the WAV file to mu-law using ffmpeg.
-        base, _ = os.path.splitext(output_file)
-        final_file = base + ".ulaw"
-        try:
-            subprocess.run([
-                "ffmpeg", "-y", "-i", output_file,
-                "-ar", "8000", "-ac", "1", "-f", "mulaw", final_file
-            ], check=True)
-            print(f"[INFO] Converted to mu-law file: {final_file}")
-        except subprocess.CalledProcessError as e:
-            print("[ERROR] ffmpeg conversion failed:", e)
-    elif result.reason == speechsdk.ResultReason.Canceled:
+        # Unique temp name so concurrent calls rendering the same prompt don't collide.
+        tmp_file = f"{final_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(result.audio_data)
+        os.replace(tmp_file, final_file)
+        log.info("Generated mu-law file: %s", final_file)
+        return True
+    if result.reason == speechsdk.ResultReason.Canceled:
         cancellation_details = result.cancellation_details
-        print("[ERROR] TTS file generation canceled:", cancellation_details.reason)
+        log.error("TTS file generation canceled: %s", cancellation_details.reason)
+    return False
+
+def warmup():
+    """
+    Fills the synthesizer pool and opens each synthesizer's connection to the
+    TTS service, so DNS and TLS setup are not paid by the first prompts of a call.
+    """
+    for _ in range(TTS_POOL_SIZE - _synthesizer_pool.qsize()):
+        synthesizer = speechsdk.SpeechSynthesizer(speech_config=_speech_config(FILE_OUTPUT_FORMAT), audio_config=None)
+        speechsdk.Connection.from_speech_synthesizer(synthesizer).open(True)
+        _release_synthesizer(synthesizer)
+
+def get_cached_tts_file(text):
+    """
+    Returns the sound file for a prompt from a content-addressed cache keyed by
+    voice, output format and text, synthesizing it only on the first miss.
+    :param text: Text to be synthesized.
+    :return: Full path of the cached mu-law file without extension, suitable for agi.stream_file.
+    """
+    # The voice and output format are part of the key, so changing AZURE_TTS_VOICE
+    # never serves audio rendered with the previous voice.
+    voice = AZURE_TTS_VOICE or "en-IN-NeerjaNeural"
+    key = hashlib.blake2b(f"{voice}|ulaw8k|{text}".encode("utf-8"), digest_size=8).hexdigest()
+    cached = os.path.join(TTS_CACHE_DIR, key)
+    if not os.path.exists(cached + ".ulaw"):
+        os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+        generate_tts_file(text, cached)
+    return cached
 
 if __name__ == "__main__":
     # Test TTS: generate a file and play via default speaker
-    test_output = "/var/lib/asterisk/sounds/test_tts.wav"
+    test_output = "/var/lib/asterisk/sounds/test_tts"
     generate_tts_file("Hello, how can I assist you today?", test_output)
     text_to_speech("Hello, how can I assist you today?")
@@ -0,0 +1,43 @@
+# src/utils/intents.py
+
+import re
+
+from src.utils import logger
+
+log = logger.setup_logger()
+
+# Phrases that end the call when spoken by the caller.
+EXIT_KEYWORDS = ("bye", "exit", "quit", "end call", "end the call", "goodbye", "thank you", "that's all")
+# All exit phrases in one alternation, longest first, scanned in a single pass.
+EXIT_KEYWORDS_RE = re.compile(
+    r"\b(?:" + "|".join(re.escape(k) for k in sorted(EXIT_KEYWORDS, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE)
+
+# Any digit at all; utterances without one can't contain an order number.
+DIGIT_RE = re.compile(r"\d")
+
+# Matches an order number introduced as one, e.g. "my order id is 1113".
+ORDER_NUMBER_RE = re.compile(r'\border(?:\s*(?:id|number))?\s*(?:is|was|should be|supposed to be)?\s*[:#]?\s*(\d{3,10})\b', re.IGNORECASE)
+# Fallback when no number follows "order": the first standalone run of 3-10 digits.
+DIGIT_RUN_RE = re.compile(r'\b(\d{3,10})\b')
+
+def extract_order_number(text):
+    """
+    Extracts an order number from user input using regex.
+    :param text: Recognized user utterance.
+    :return: The order number as a string, or None if there is none.
+    """
+    # Cheap bail-out before the regex for turns like "yes please"
+    if not DIGIT_RE.search(text):
+        log.debug("No order number found in the input.")
+        return None
+    match = ORDER_NUMBER_RE.search(text) or DIGIT_RUN_RE.search(text)
+    if match:
+        log.debug("Extracted order number via Regex: %s", match.group(1))
+        return match.group(1)
+    # If user ONLY says a number, assume it's an order ID
+    if text.strip().isdigit():
+        log.debug("Extracted standalone order number: %s", text.strip())
+        return text.strip()
+    log.debug("No order number found in the input.")
+    return None
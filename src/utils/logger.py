@@ -1,19 +1,64 @@
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
+
+LOG_FILE = '/var/log/ai_voice_support_bot.log'
+
+# The format only uses time, level and message, so skip collecting caller,
+# thread and process details for every record (see "Optimization" in the
+# logging HOWTO).
+logging._srcfile = None
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
+
+_listener = None
+
+def _start_listener(queue_handler, handlers):
+    """
+    Points the queue handler at a fresh queue and starts a listener thread that
+    writes its records to the real handlers.
+    """
+    global _listener
+    queue_handler.queue = queue.Queue()
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+def stop_listener():
+    """
+    Writes out every queued record and stops the listener thread. Runs at exit;
+    call it directly before os._exit(), which skips atexit handlers.
+    """
+    if _listener is not None:
+        _listener.stop()
 
 def setup_logger():
     logger = logging.getLogger(__name__)
+    # Already configured (e.g. by an earlier call in this process); adding the
+    # handlers again would duplicate every log line.
+    if logger.handlers:
+        return logger
     logger.setLevel(logging.INFO)
-    # Create file handler which logs even debug messages
-    fh = logging.FileHandler('/var/log/ai_voice_support_bot.log')
-    fh.setLevel(logging.INFO)
     formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+    # Reopens the file after an external logrotate, which stays safe with several
+    # worker processes appending to the same file.
+    fh = logging.handlers.WatchedFileHandler(LOG_FILE)
+    fh.setLevel(logging.INFO)
     fh.setFormatter(formatter)
-    logger.addHandler(fh)
     # Also add a stream handler if you want to see logs on the console
     sh = logging.StreamHandler()
     sh.setLevel(logging.INFO)
     sh.setFormatter(formatter)
-    logger.addHandler(sh)
+    # Callers only enqueue records; a background listener does the disk and
+    # console writes.
+    qh = logging.handlers.QueueHandler(queue.Queue())
+    logger.addHandler(qh)
+    _start_listener(qh, (fh, sh))
+    # The listener thread does not survive fork(), so each worker starts its own.
+    os.register_at_fork(after_in_child=lambda: _start_listener(qh, (fh, sh)))
+    atexit.register(stop_listener)
     return logger
 
 logger = setup_logger()